@@ -1,4 +1,7 @@
 import argparse
+import asyncio
+import diskcache
+import hashlib
 import httpx
 import json
 import llm
@@ -7,12 +10,10 @@ import random
 import re
 
 from dataclasses import dataclass
-from datetime import (
-    date,
-    datetime,
-)
+from datetime import date
 from enum import Enum
-from typing import Dict, List, Set
+from functools import lru_cache
+from typing import Dict, List, Optional, Set
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -24,8 +25,10 @@ CATEGORY_SIZE = 4
 NUM_CATEGORIES = 4
 MAX_CONSECUTIVE_INVALID_ATTEMPTS = 3
 
-# Set a fixed seed for the random number generator for _some_ reproducibility
-random.seed(42)
+GAME_DATA_URL = "https://www.nytimes.com/svc/connections/v2/{date}.json"
+
+_SCRATCHPAD_RE = re.compile(r"<scratchpad>.*?</scratchpad>", re.DOTALL)
+_CODE_FENCE_RE = re.compile(r"```(.*?)```", re.DOTALL)
 
 START_MESSAGE = """"Connections" is a word categorization game. I will provide you with 16 words, and your goal is to find four groups of four words that share a common category. Each word will belong to only one category in the correct solution. Be careful of words that seem like they could fit in more than one category. Consider guessing other categories first to improve your chances of success by elimination of more obvious groups. You have a maximum of four incorrect guesses, so choose carefully!
 
@@ -110,19 +113,53 @@ class GuessResult(Enum):
 class Guess:
     words: Set[str]
     result: GuessResult
+    mask: int = 0
 
     def __repr__(self):
         return f"Guess(words={self.words}, result={self.result.value})"
 
 
 class LLMGuesser(object):
-    def __init__(self, model):
-        self.model = llm.get_model(model)
+    def __init__(self, model: llm.AsyncModel, cache: Optional[diskcache.Cache] = None):
+        self.model = model
+        self.cache = cache
+        self.history: List[str] = []
         self.conversation = self.model.conversation()
+        # Plugins that expose a `cache` option (e.g. Anthropic) get it switched
+        # on, so the unchanged leading game instructions can be reused
+        self.options = (
+            {"cache": True} if "cache" in self.model.Options.model_fields else {}
+        )
+
+    def cache_key(self, prompt) -> str:
+        # Key on the whole turn chain rather than just the latest prompt, since
+        # feedback like "Incorrect" repeats across games with different context
+        turns = [self.model.model_id, *self.history, prompt]
+        return hashlib.sha256("\x00".join(turns).encode()).hexdigest()
+
+    async def make_guess(self, prompt) -> str:
+        response = self.conversation.prompt(prompt, **self.options)
+
+        key = self.cache_key(prompt) if self.cache is not None else None
+        text = self.cache.get(key) if key else None
+        if text is None:
+            text = await response.text()
+            if key:
+                self.cache.set(key, text)
+        else:
+            logger.info(f"Using cached response for {self.model.model_id}")
+            # Complete the response the same way llm does when loading logged
+            # responses, so later turns still send this one as context
+            if not hasattr(response, "_chunks") or not hasattr(response, "_done"):
+                raise RuntimeError(
+                    "Cached responses can't be replayed with this llm version"
+                )
+            response._chunks = [text]
+            response._done = True
+            self.conversation.responses.append(response)
 
-    def make_guess(self, prompt) -> str:
-        response = self.conversation.prompt(prompt)
-        return response.text()
+        self.history.extend([prompt, text])
+        return text
 
 
 @dataclass
@@ -130,23 +167,32 @@ class ParsedGuess:
     valid: bool
     guess_set: Set[str]
     reason: str
+    mask: int = 0
 
 
 class GameState:
     def __init__(self, categories: List[Category]):
         self.categories = categories
-        self.words = [word for category in categories for word in category.words]
-        random.shuffle(self.words)
+        # Shuffle with an RNG seeded from the puzzle itself, so a puzzle always
+        # gets the same word order regardless of which games ran before it
+        self.words = sorted(word for category in categories for word in category.words)
+        random.Random(",".join(self.words)).shuffle(self.words)
         self.remaining_mistakes = ALLOWED_MISTAKES
         self.num_correct_guesses = 0
         self.guesses: List[Guess] = []
         self.is_over = False
         self.consecutive_invalid_attempts = 0
+        self._correct_guesses: List[Guess] = []
+        self._correct_words: Set[str] = set()
+        self._guessed_masks: Set[int] = set()
 
     def add_guess(self, guess: Guess):
         self.guesses.append(guess)
+        self._guessed_masks.add(guess.mask)
         if guess.result == GuessResult.CORRECT:
             self.num_correct_guesses += 1
+            self._correct_guesses.append(guess)
+            self._correct_words.update(guess.words)
             self.consecutive_invalid_attempts = 0
         elif guess.result == GuessResult.INVALID:
             self.consecutive_invalid_attempts += 1
@@ -154,29 +200,33 @@ class GameState:
             self.remaining_mistakes -= 1
             self.consecutive_invalid_attempts = 0
 
-    def guessed_sets(self) -> List[Set[str]]:
-        return [g.words for g in self.guesses]
+    def guessed_masks(self) -> Set[int]:
+        return self._guessed_masks
 
     def correct_guesses(self) -> List[Guess]:
-        return [g for g in self.guesses if g.result == GuessResult.CORRECT]
+        return self._correct_guesses
 
     def any_word_already_in_correct_category(self, words: Set[str]) -> bool:
-        guessed_words_set = set()
-        for g in self.correct_guesses():
-            guessed_words_set.update(g.words)
-        return bool(words.intersection(guessed_words_set))
+        return not self._correct_words.isdisjoint(words)
 
 
 class GuessEvaluator:
     def __init__(self, categories: List[Category], words: List[str]):
         self.categories = categories
         self.words = words
+        # Each of the 16 words gets a bit, so a group of words is a 16-bit mask
+        # and comparing groups is integer arithmetic instead of set operations.
+        self.word_to_bit = {word: 1 << i for i, word in enumerate(words)}
+        self.category_masks = [
+            sum(self.word_to_bit[word] for word in category.words)
+            for category in categories
+        ]
 
     def parse_guess(self, guess: str) -> ParsedGuess:
         # remove scratchpad
-        guess = re.sub(r"<scratchpad>.*?</scratchpad>", "", guess, flags=re.DOTALL)
+        guess = _SCRATCHPAD_RE.sub("", guess)
         # extract json guess from inside backticks
-        guess_match = re.search(r"```(.*?)```", guess, re.DOTALL)
+        guess_match = _CODE_FENCE_RE.search(guess)
         if not guess_match:
             return ParsedGuess(False, set(), "Your guess was not between code fences")
         guess = guess_match.group(1).strip()
@@ -186,31 +236,52 @@ class GuessEvaluator:
             return ParsedGuess(
                 False, set(), "Your guess JSON was incorrectly formatted"
             )
-        guess_tokens = list(guess_dict.values())[0]
+        guess_values = (
+            next(iter(guess_dict.values()), None)
+            if isinstance(guess_dict, dict)
+            else None
+        )
+        if isinstance(guess_values, list):
+            guess_tokens = {v for v in guess_values if isinstance(v, str)}
+        elif isinstance(guess_values, str):
+            # a string value still gets substring matching, as before
+            guess_tokens = guess_values
+        else:
+            return ParsedGuess(
+                False, set(), "Your guess JSON was incorrectly formatted"
+            )
 
-        logger.info(f"Guess tokens: {guess_tokens}")
+        logger.info(f"Guess tokens: {guess_values}")
         guess_set: Set[str] = set()
+        mask = 0
         for word in self.words:
             if word in guess_tokens:
                 guess_set.add(word)
+                mask |= self.word_to_bit[word]
         logger.info(f"Guess set: {guess_set}")
         if len(guess_set) != CATEGORY_SIZE:
-            return ParsedGuess(False, guess_set, "Your guess must contain 4 words")
+            return ParsedGuess(
+                False, guess_set, "Your guess must contain 4 words", mask
+            )
 
-        return ParsedGuess(True, guess_set, "")
+        return ParsedGuess(True, guess_set, "", mask)
 
     def evaluate_guess(
-        self, guess_set: Set[str], guessed_sets: List[Set[str]]
+        self, parsed_guess: ParsedGuess, guessed_masks: Set[int]
     ) -> Guess:
-        if guess_set in guessed_sets:
-            return Guess(words=guess_set, result=GuessResult.INVALID)
+        guess_set = parsed_guess.guess_set
+        mask = parsed_guess.mask
+        if mask in guessed_masks:
+            return Guess(words=guess_set, result=GuessResult.INVALID, mask=mask)
 
-        for category in self.categories:
-            if category.words == guess_set:
-                return Guess(words=guess_set, result=GuessResult.CORRECT)
-            if len(category.words.intersection(guess_set)) == 3:
-                return Guess(words=guess_set, result=GuessResult.THREE_OUT_OF_FOUR)
-        return Guess(words=guess_set, result=GuessResult.INCORRECT)
+        for category_mask in self.category_masks:
+            if category_mask == mask:
+                return Guess(words=guess_set, result=GuessResult.CORRECT, mask=mask)
+            if (category_mask & mask).bit_count() == 3:
+                return Guess(
+                    words=guess_set, result=GuessResult.THREE_OUT_OF_FOUR, mask=mask
+                )
+        return Guess(words=guess_set, result=GuessResult.INCORRECT, mask=mask)
 
 
 class Game:
@@ -220,20 +291,20 @@ class Game:
         self.evaluator = GuessEvaluator(categories, self.state.words)
         self.prompt = prompt.format(words="\n".join(self.state.words))
 
-    def play(self):
+    async def play(self):
         while (
             self.state.remaining_mistakes > 0
             and self.state.num_correct_guesses != NUM_CATEGORIES
             and self.state.consecutive_invalid_attempts
             < MAX_CONSECUTIVE_INVALID_ATTEMPTS
         ):
-            self.do_turn()
+            await self.do_turn()
         logger.info(self.prompt)
         return self.state.num_correct_guesses == NUM_CATEGORIES
 
-    def do_turn(self):
+    async def do_turn(self):
         logger.info(self.prompt)
-        guess_model_response: str = self.guesser.make_guess(self.prompt)
+        guess_model_response: str = await self.guesser.make_guess(self.prompt)
         logger.info(guess_model_response)
         parsed_guess = self.evaluator.parse_guess(guess_model_response)
         if not parsed_guess.valid:
@@ -244,12 +315,16 @@ class Game:
         if self.state.any_word_already_in_correct_category(parsed_guess.guess_set):
             self.prompt = "Your guess was invalid. You cannot use a word in more than one category."
             self.state.add_guess(
-                Guess(words=parsed_guess.guess_set, result=GuessResult.INVALID)
+                Guess(
+                    words=parsed_guess.guess_set,
+                    result=GuessResult.INVALID,
+                    mask=parsed_guess.mask,
+                )
             )
             return
 
         guess_result: Guess = self.evaluator.evaluate_guess(
-            parsed_guess.guess_set, self.state.guessed_sets()
+            parsed_guess, self.state.guessed_masks()
         )
 
         self.state.add_guess(guess_result)
@@ -266,8 +341,12 @@ class Game:
         self.prompt += f" You have {self.state.remaining_mistakes} guess{'es' if self.state.remaining_mistakes > 1 else ''} remaining."
         if self.state.correct_guesses():
             self.prompt += "\nCorrect guesses so far: "
+            # Same {'A', 'B', ...} format as before, but in a stable order
             self.prompt += " ".join(
-                [str(g.words) for g in self.state.correct_guesses()]
+                [
+                    "{" + ", ".join(repr(word) for word in sorted(g.words)) + "}"
+                    for g in self.state.correct_guesses()
+                ]
             )
 
     def result(self):
@@ -284,53 +363,48 @@ class Game:
         return self.state
 
 
+@lru_cache(maxsize=None)
 def puzzle_number(end):
-    start = FIRST_GAME_DATE
-    first_game_date = datetime.strptime(start, "%Y-%m-%d")
-    current_game_date = datetime.strptime(end, "%Y-%m-%d")
+    first_game_date = date.fromisoformat(FIRST_GAME_DATE)
+    current_game_date = date.fromisoformat(end)
     return (current_game_date - first_game_date).days + 1
 
 
 def format_game_result(
     model: str, game_date: str, categories: List[Category], guesses: List[Guess]
 ):
-    emoji_to_category_dict: Dict[frozenset[str], str] = {
-        frozenset(categories[0].words): "🟩",
-        frozenset(categories[1].words): "🟨",
-        frozenset(categories[2].words): "🟦",
-        frozenset(categories[3].words): "🟪",
+    word_to_emoji: Dict[str, str] = {
+        word: emoji
+        for category, emoji in zip(categories, ["🟩", "🟨", "🟦", "🟪"])
+        for word in category.words
     }
     out_str = f"🤖 Connections ({model}) \nPuzzle #{puzzle_number(game_date)}\n"
     for guess in guesses:
         if guess.result != GuessResult.INVALID:
-            guess_str = ""
-            for word in list(sorted(guess.words)):
-                for category, emoji in emoji_to_category_dict.items():
-                    if word in category:
-                        guess_str += emoji
-                        break
-            guess_str += "\n"
-            out_str += guess_str
+            guess_str = "".join(word_to_emoji[word] for word in sorted(guess.words))
+            out_str += guess_str + "\n"
     return out_str.strip()
 
 
 def get_categories(game_data) -> List[Category]:
-    return [
-        Category(
-            name=category["title"],
-            words=set(card["content"] for card in category["cards"]),
-            level=category["cards"][0]["position"] // 4,
+    categories = []
+    for category in game_data["categories"]:
+        cards = category["cards"]
+        categories.append(
+            Category(
+                name=category["title"],
+                words={card["content"] for card in cards},
+                level=cards[0]["position"] // 4,
+            )
         )
-        for category in game_data["categories"]
-    ]
+    return categories
 
 
-def fetch_game_data(game_date):
-    url = f"https://www.nytimes.com/svc/connections/v2/{game_date}.json"
-    with httpx.Client() as client:
-        response = client.get(url)
-        response.raise_for_status()
-        return response.json()
+async def fetch_game_data(client: httpx.AsyncClient, game_date):
+    url = GAME_DATA_URL.format(date=game_date)
+    response = await client.get(url)
+    response.raise_for_status()
+    return response.json()
 
 
 def read_game_data(game_date):
@@ -340,7 +414,7 @@ def read_game_data(game_date):
     return game_data
 
 
-if __name__ == "__main__":
+async def main():
     parser = argparse.ArgumentParser(description="Run the Connections game")
     parser.add_argument("model", help="The model to use for the game")
     parser.add_argument(
@@ -356,15 +430,16 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     game_date = args.date
-    game_data = fetch_game_data(game_date)
+    async with httpx.AsyncClient(http2=True, timeout=30) as client:
+        game_data = await fetch_game_data(client, game_date)
     categories = get_categories(game_data)
 
     model = args.model
     with open(args.prompt, "r") as file:
         prompt = file.read()
-    guesser = LLMGuesser(model)
+    guesser = LLMGuesser(llm.get_async_model(model))
     game = Game(START_MESSAGE, categories, guesser)
-    won = game.play()
+    won = await game.play()
     conversation = game.result()
     result = format_game_result(
         model,
@@ -373,3 +448,7 @@ if __name__ == "__main__":
         game.state.guesses,
     )
     logger.info(result)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
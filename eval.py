@@ -1,6 +1,8 @@
 import asyncio
+import diskcache
 import hashlib
-import json
+import llm
+import orjson
 import os
 import argparse
 from datetime import datetime, timedelta
@@ -15,7 +17,7 @@ from connections import (
 )
 
 
-def run_eval(prompt, model, game_date):
+async def run_eval(prompt, prompt_hash, model, llm_model, response_cache, game_date):
     # Fetch game data
     game_data = read_game_data(game_date)
 
@@ -23,21 +25,21 @@ def run_eval(prompt, model, game_date):
     categories = get_categories(game_data)
 
     # Initialize guesser and game
-    guesser = LLMGuesser(model)
+    guesser = LLMGuesser(llm_model, response_cache)
     game = Game(prompt, categories, guesser)
 
-    won = game.play()
+    won = await game.play()
     print(won)
 
     game_state = game.result()
-    return write_stats(prompt, model, game_date, game_state)
+    return write_stats(prompt_hash, model, game_date, game_state)
 
 
-def write_stats(prompt, model, game_date, game_state):
+def write_stats(prompt_hash, model, game_date, game_state):
     # Create a dictionary with the required information
     stats = {
         "model": model,
-        "prompt_hash": hashlib.sha256(prompt.encode()).hexdigest(),
+        "prompt_hash": prompt_hash,
         "game_date": game_date,
         "levels": {
             0: False,
@@ -57,44 +59,46 @@ def write_stats(prompt, model, game_date, game_state):
     return stats
 
 
-async def process_date(prompt, model, date_str, file_lock, filename):
+def load_existing_stats(filename):
+    existing_stats = {}
+    with open(f"results/{filename}", "rb") as f:
+        for line in f:
+            stats = orjson.loads(line)
+            existing_stats[(stats["model"], stats["game_date"])] = stats
+    return existing_stats
+
+
+async def process_date(
+    prompt,
+    prompt_hash,
+    model,
+    llm_model,
+    response_cache,
+    date_str,
+    file_lock,
+    filename,
+    existing_stats,
+):
     print(f"Checking evaluation for {date_str}")
 
-    async with file_lock:
-        with open(f"results/{filename}", "r") as f:
-            for line in f:
-                existing_stats = json.loads(line.strip())
-                if (
-                    existing_stats["model"] == model
-                    and existing_stats["game_date"] == date_str
-                ):
-                    print(f"Evaluation for {date_str} already exists. Skipping.")
-                    return existing_stats
+    if (model, date_str) in existing_stats:
+        print(f"Evaluation for {date_str} already exists. Skipping.")
+        return existing_stats[(model, date_str)]
 
     print(f"Running evaluation for {date_str}")
-    stats = await asyncio.to_thread(run_eval, prompt, model, date_str)
+    stats = await run_eval(
+        prompt, prompt_hash, model, llm_model, response_cache, date_str
+    )
 
     async with file_lock:
-        with open(f"results/{filename}", "a") as f:
-            json_stats = json.dumps(stats)
-            f.write(json_stats + "\n")
+        with open(f"results/{filename}", "ab") as f:
+            # levels keeps its integer keys, serialized as "0".."3" like before
+            json_stats = orjson.dumps(stats, option=orjson.OPT_NON_STR_KEYS)
+            f.write(json_stats + b"\n")
 
     return stats
 
 
-async def constrained_execution(funcs, max_runs):
-    jobs = []
-    semaphore = asyncio.Semaphore(max_runs)
-
-    async def job(fn):
-        async with semaphore:
-            return await fn()
-
-    for func in funcs:
-        jobs.append(asyncio.ensure_future(job(func)))
-    return await asyncio.gather(*jobs)
-
-
 async def main():
     parser = argparse.ArgumentParser(
         description="Run evaluations for Connections game."
@@ -107,32 +111,60 @@ async def main():
         default=10,
         help="Number of parallel executions (default: 10)",
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always call the model instead of reusing cached responses",
+    )
     args = parser.parse_args()
 
     model = args.model
+    # Load the model once and share it, each game still gets its own conversation
+    llm_model = llm.get_async_model(model)
+    # LLM replies are cached on disk so reruns after code changes that keep
+    # the prompts the same don't hit the provider again
+    response_cache = None if args.no_cache else diskcache.Cache(".llmcache")
     prompt = START_MESSAGE
 
     os.makedirs("results", exist_ok=True)
 
-    filename = f"{model}_{hashlib.sha256(prompt.encode()).hexdigest()}.jsonl"
+    prompt_hash = hashlib.sha256(prompt.encode()).hexdigest()
+    filename = f"{model}_{prompt_hash}.jsonl"
     open(f"results/{filename}", "a").close()
 
     start_date = datetime.strptime(FIRST_GAME_DATE, "%Y-%m-%d").date()
     end_date = datetime.now().date()
 
-    filename = f"{model}_{hashlib.sha256(prompt.encode()).hexdigest()}.jsonl"
     file_lock = asyncio.Lock()
+    existing_stats = load_existing_stats(filename)
 
-    fns = []
+    date_strs = []
     current_date = start_date
     while current_date <= end_date:
-        date_str = current_date.strftime("%Y-%m-%d")
-        fns.append(
-            lambda d=date_str: process_date(prompt, model, d, file_lock, filename)
-        )
+        date_strs.append(current_date.strftime("%Y-%m-%d"))
         current_date += timedelta(days=1)
 
-    all_stats = await constrained_execution(fns, args.parallelism)
+    semaphore = asyncio.Semaphore(args.parallelism)
+
+    async def gated(date_str):
+        async with semaphore:
+            return await process_date(
+                prompt,
+                prompt_hash,
+                model,
+                llm_model,
+                response_cache,
+                date_str,
+                file_lock,
+                filename,
+                existing_stats,
+            )
+
+    try:
+        all_stats = await asyncio.gather(*(gated(d) for d in date_strs))
+    finally:
+        if response_cache is not None:
+            response_cache.close()
 
 
 if __name__ == "__main__":
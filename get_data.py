@@ -1,17 +1,33 @@
-import httpx
+import aiofiles
+import aiohttp
+import asyncio
 import json
 import os
 from datetime import timedelta, datetime
-from connections import FIRST_GAME_DATE
+from connections import FIRST_GAME_DATE, GAME_DATA_URL
 
+MAX_CONCURRENT_FETCHES = 32
 
-def main(url):
+
+async def fetch_and_save(session, semaphore, formatted_date, file_path):
+    async with semaphore:
+        print(f"Fetching data for {formatted_date}")
+        async with session.get(GAME_DATA_URL.format(date=formatted_date)) as response:
+            response.raise_for_status()
+            response_object = await response.json()
+
+    async with aiofiles.open(file_path, "w") as f:
+        await f.write(json.dumps(response_object, indent=2))
+
+
+async def main():
     if not os.path.exists("connections_data"):
         os.makedirs("connections_data")
 
     end_date = datetime.now()
     current_date = end_date
 
+    missing_dates = []
     while current_date >= datetime.strptime(FIRST_GAME_DATE, "%Y-%m-%d"):
         formatted_date = current_date.strftime("%Y-%m-%d")
         file_path = f"connections_data/{formatted_date}.json"
@@ -19,17 +35,25 @@ def main(url):
         if os.path.exists(file_path):
             print(f"Found existing file for {formatted_date}. Skipping.")
         else:
-            print(f"Fetching data for {formatted_date}")
-            u = url.format(date=formatted_date)
-            response = httpx.get(u)
-            response_object = response.json()
-
-            with open(file_path, "w") as f:
-                json.dump(response_object, f, indent=2)
+            missing_dates.append((formatted_date, file_path))
 
         current_date -= timedelta(days=1)
 
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_FETCHES)
+    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENT_FETCHES)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        results = await asyncio.gather(
+            *(
+                fetch_and_save(session, semaphore, formatted_date, file_path)
+                for formatted_date, file_path in missing_dates
+            ),
+            return_exceptions=True,
+        )
+
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"Failed to fetch data: {result}")
+
 
 if __name__ == "__main__":
-    url = "https://www.nytimes.com/svc/connections/v2/{date}.json"
-    main(url)
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+import asyncio
+import diskcache
+import json
+import llm
+import pytest
+
+from connections import (
+    GameState,
+    GuessEvaluator,
+    GuessResult,
+    LLMGuesser,
+    get_categories,
+)
+
+
+class FakeModel(llm.AsyncModel):
+    model_id = "fake"
+
+    def __init__(self):
+        self.history_lengths = []
+
+    async def execute(self, prompt, stream, response, conversation):
+        self.history_lengths.append(len(conversation.responses))
+        yield f"reply to {prompt.prompt}"
+
+
+def make_categories(prefix):
+    game_data = {
+        "categories": [
+            {
+                "title": f"Category {i}",
+                "cards": [
+                    {"content": f"{prefix}{i}{j}", "position": i * 4 + j}
+                    for j in range(4)
+                ],
+            }
+            for i in range(4)
+        ]
+    }
+    return get_categories(game_data)
+
+
+def make_evaluator():
+    categories = make_categories("W")
+    return GuessEvaluator(categories, GameState(categories).words)
+
+
+def fenced(guess_json):
+    return f"<scratchpad>thinking</scratchpad>\n```\n{guess_json}\n```"
+
+
+@pytest.mark.parametrize(
+    "guess_json",
+    ["{}", "[1]", '{"a": [["x"]]}', '{"a": 5}'],
+)
+def test_parse_guess_rejects_malformed_json_values(guess_json):
+    parsed = make_evaluator().parse_guess(fenced(guess_json))
+    assert not parsed.valid
+    assert parsed.guess_set == set()
+
+
+def test_parse_guess_matches_words_in_a_string_value():
+    parsed = make_evaluator().parse_guess(fenced('{"a": "W00, W01, W02, W03"}'))
+    assert parsed.valid
+    assert parsed.guess_set == {"W00", "W01", "W02", "W03"}
+
+
+def test_word_order_does_not_depend_on_earlier_games():
+    first = GameState(make_categories("A")).words
+    GameState(make_categories("B"))
+    assert GameState(make_categories("A")).words == first
+
+
+def test_cache_hit_then_miss_sends_full_history(tmp_path):
+    cache = diskcache.Cache(tmp_path / "llmcache")
+
+    async def play(guesser, prompts):
+        return [await guesser.make_guess(prompt) for prompt in prompts]
+
+    first_model = FakeModel()
+    asyncio.run(play(LLMGuesser(first_model, cache), ["one", "two"]))
+    assert first_model.history_lengths == [0, 1]
+
+    second_model = FakeModel()
+    guesser = LLMGuesser(second_model, cache)
+    replies = asyncio.run(play(guesser, ["one", "two", "three"]))
+
+    # Only the last turn reaches the model, with both cached turns as context
+    assert second_model.history_lengths == [2]
+    assert replies == ["reply to one", "reply to two", "reply to three"]
+    assert [r.prompt.prompt for r in guesser.conversation.responses] == [
+        "one",
+        "two",
+        "three",
+    ]
+
+
+def evaluate(evaluator, words, guessed_masks=()):
+    parsed = evaluator.parse_guess(fenced(json.dumps({"a": words})))
+    return evaluator.evaluate_guess(parsed, set(guessed_masks))
+
+
+def test_evaluate_guess_correct():
+    guess = evaluate(make_evaluator(), ["W00", "W01", "W02", "W03"])
+    assert guess.result == GuessResult.CORRECT
+
+
+def test_evaluate_guess_three_out_of_four():
+    guess = evaluate(make_evaluator(), ["W00", "W01", "W02", "W10"])
+    assert guess.result == GuessResult.THREE_OUT_OF_FOUR
+
+
+def test_evaluate_guess_repeat_is_invalid():
+    evaluator = make_evaluator()
+    first = evaluate(evaluator, ["W00", "W01", "W10", "W11"])
+    assert first.result == GuessResult.INCORRECT
+    repeat = evaluate(evaluator, ["W11", "W10", "W01", "W00"], [first.mask])
+    assert repeat.result == GuessResult.INVALID